@@ -1,7 +1,8 @@
+import random
 from typing import List, Optional, Generator
-import re
 
-from const import pat_gridcular_seq
+from board_patterns import pat3_cell_codes
+from const import pat_gridcular_seq, pat_gridcular_dys, pat_gridcular_dxs, pat_gridcular_diam_ends
 from large_patterns import large_patterns_store
 from spat_patterns_store import spatial_pattern_store
 
@@ -13,94 +14,359 @@ class Board:
     MAX_GAME_LEN = N * N * 3
 
     empty = "\n".join([(N + 1) * ' '] + N * [' ' + N * '.'] + [(N + 2) * ' '])
-    # Regex that matches various kind of points adjacent to '#' (flood-filled) points
-    contact_res = dict()
-    _encoding = "utf-8"
+    _encoding = "ascii"
+    # Per-coordinate neighbor tables, filled in by _initialize_board_statics()
+    NEIGH = ()
+    DIAG = ()
+    # point plus its 8 surrounding points, for last_moves_neighbors()
+    NEIGH9 = ()
+    # dist -> per-coordinate tuple of on-board points within Manhattan
+    # distance dist, for empty_area()
+    MANHATTAN_DISC = dict()
+    # c -> (row, col), folding divmod(c - (W + 1), W) at import time
+    ROWCOL = ()
+    # c -> line number above the nearest edge, for line_height()
+    LINE_HEIGHT = ()
+    _empty_buf = bytes(empty, encoding=_encoding)  # interned template for fresh()
+    # shared visited scratch for floodfill_reaches(); re-zeroed on exit
+    _flood_visited = bytearray(W2)
+    # Zobrist tables for board_hash(): one 64-bit key per (point, color),
+    # filled in by _initialize_board_statics()
+    _ZOB_X = ()
+    _ZOB_x = ()
+    _swapcase_table = bytes.maketrans(b'XxOo', b'xXoO')
+    # (board_hash, c) -> large-scale pattern probability; tree descent
+    # re-evaluates identical positions, so the gridcular walk is memoized
+    _large_pattern_cache = dict()
+    _LARGE_PATTERN_CACHE_SIZE = 32 * 1024
+    # Byte-value -> 0/1 translate tables for occupancy_mask(), filled in
+    # by _initialize_board_statics()
+    _mask_tables = dict()
+    # byte value -> 2-bit cell code for neighborhood_33_code(), filled in
+    # by _initialize_board_statics()
+    _CELL_CODE = ()
+    # Gridcular neighborhood tables, filled in by _initialize_board_statics():
+    # per-diameter, per-rotation index deltas into the padded board view
+    _GRIDCULAR_PAD = max(max(abs(dy), abs(dx)) for dseq in pat_gridcular_seq for dy, dx in dseq)
+    _PW = N + 2 * _GRIDCULAR_PAD
+    _GRIDCULAR_OFFSETS = ()
 
     def __init__(self, board_data: Optional[str] = None):
-        self.board = board_data or self.empty
+        if board_data is None:
+            self._buf = bytearray(self._empty_buf)
+            self._board_str = self.empty
+        else:
+            self._buf = bytearray(board_data, encoding=self._encoding)
+            self._board_str = board_data
+        self._flood_cells = None
+        self._hash = None
+        self._hash_swap = None
+        self._wboard = None
+        self._swapped = None
+        self._masks = dict()
+        self._nh33_cache = dict()
+
+    @classmethod
+    def fresh(cls) -> "Board":
+        """ fast factory for an empty board: clone the interned template
+        buffer, no str encode involved """
+        board = cls._from_buf(bytearray(cls._empty_buf))
+        board._board_str = cls.empty
+        return board
+
+    @classmethod
+    def _from_buf(cls, buf: bytearray) -> "Board":
+        """ wrap an already-built buffer without the str round-trip """
+        board = cls.__new__(cls)
+        board._buf = buf
+        board._board_str = None
+        board._flood_cells = None
+        board._hash = None
+        board._hash_swap = None
+        board._wboard = None
+        board._swapped = None
+        board._masks = dict()
+        board._nh33_cache = dict()
+        return board
+
+    @property
+    def board(self) -> str:
+        # The canonical state lives in self._buf; the str view is derived
+        # lazily and memoized, as the hot playout path never needs it
+        if self._board_str is None:
+            self._board_str = self._buf.decode(self._encoding)
+        return self._board_str
+
+    @board.setter
+    def board(self, board_data: str) -> None:
+        self._buf = bytearray(board_data, encoding=self._encoding)
+        self._board_str = board_data
+        self._flood_cells = None
+        self._hash = None
+        self._hash_swap = None
+        self._wboard = None
+        self._swapped = None
+        self._masks = dict()
+        self._nh33_cache = dict()
+
+    def board_hash(self) -> int:
+        """ Zobrist identity of the board contents.  Position.move and
+        swapcase() maintain the hash incrementally (together with its
+        color-swapped twin in _hash_swap, so the per-move perspective
+        flip is a constant-time exchange); the full scan below only
+        runs for boards built from scratch """
+        if self._hash is None:
+            h = s = 0
+            ZX, Zx = self._ZOB_X, self._ZOB_x
+            buf = self._buf
+            for c in range(self.W2):
+                b = buf[c]
+                if b == 0x58:  # 'X'
+                    h ^= ZX[c]
+                    s ^= Zx[c]
+                elif b == 0x78:  # 'x'
+                    h ^= Zx[c]
+                    s ^= ZX[c]
+            self._hash = h
+            self._hash_swap = s
+        return self._hash
+
+    def occupancy_mask(self, p: str) -> int:
+        """ big-int occupancy map of color p, one byte lane per point;
+        built with a C-level translate pass and memoized per Board.
+        This is the structure-of-arrays view of the board: stone color,
+        the off-board border and temporary overlays like '#' each get
+        their own bitmap, independent of the mixed character buffer """
+        mask = self._masks.get(p)
+        if mask is None:
+            mask = int.from_bytes(self._buf.translate(self._mask_tables[p]), 'little')
+            self._masks[p] = mask
+        return mask
 
     def floodfill(self, c) -> "Board":
         """ replace continuous-color area starting at c with special color # """
-        # This is called so much that a bytearray is worthwhile...
-        byteboard = bytearray(self.board, encoding=self._encoding)
+        byteboard, cells = self.floodfill_into(c)
+        board = Board._from_buf(byteboard)
+        board._flood_cells = cells
+        return board
+
+    def floodfill_into(self, c):
+        """ like floodfill, but hand back the raw flooded buffer and the
+        list of flooded cells without wrapping them in a Board; for hot
+        callers (fix_atari) that only need contact_on() afterwards """
+        byteboard = bytearray(self._buf)
+        W = self.W
         p = byteboard[c]
-        byteboard[c] = ord('#')
-        fringe = [c]
-        while fringe:
-            c = fringe.pop()
-            for d in self.neighbors(c):
+        byteboard[c] = 0x23  # '#'
+        # cells doubles as the BFS queue (head index) and the record of
+        # flooded points that contact_on() scans later
+        cells = [c]
+        head = 0
+        while head < len(cells):
+            c = cells[head]
+            head += 1
+            for d in (c - 1, c + 1, c - W, c + W):
                 if byteboard[d] == p:
-                    byteboard[d] = ord('#')
-                    fringe.append(d)
-        return Board(byteboard.decode(self._encoding))
+                    byteboard[d] = 0x23
+                    cells.append(d)
+        return byteboard, cells
+
+    def floodfill_libs(self, c):
+        """ fused floodfill + liberty search: flood the group at c and
+        collect its first (up to) three distinct liberties in the same
+        pass, marking them 'L' in the returned private buffer.  Saves
+        the separate contact_on() passes in the atari-check hot path;
+        liberties come out in the same order those scans would find
+        them """
+        byteboard = bytearray(self._buf)
+        W = self.W
+        p = byteboard[c]
+        byteboard[c] = 0x23  # '#'
+        cells = [c]
+        libs = []
+        head = 0
+        while head < len(cells):
+            c = cells[head]
+            head += 1
+            for d in (c - 1, c + 1, c - W, c + W):
+                b = byteboard[d]
+                if b == p:
+                    byteboard[d] = 0x23
+                    cells.append(d)
+                elif b == 0x2e and len(libs) < 3:  # '.'
+                    byteboard[d] = 0x4c  # 'L', also dedupes the record
+                    libs.append(d)
+        return byteboard, cells, libs
+
+    def floodfill_reaches(self, c):
+        """ flood the region at c without cloning the buffer: return the
+        region's cells and whether it touches 'X' and/or 'x'.  The
+        visited marks live in a shared class-level scratch that is
+        re-zeroed on the way out, so the only per-call allocation is
+        the cells list; this serves Position.score, which only needs
+        reachability, not a marked-up board """
+        buf = self._buf
+        W = self.W
+        p = buf[c]
+        visited = self._flood_visited
+        visited[c] = 1
+        cells = [c]
+        touches_X = touches_x = False
+        head = 0
+        while head < len(cells):
+            c = cells[head]
+            head += 1
+            for d in (c - 1, c + 1, c - W, c + W):
+                b = buf[d]
+                if b == p:
+                    if not visited[d]:
+                        visited[d] = 1
+                        cells.append(d)
+                elif b == 0x58:  # 'X'
+                    touches_X = True
+                elif b == 0x78:  # 'x'
+                    touches_x = True
+        for c in cells:
+            visited[c] = 0
+        return cells, touches_X, touches_x
+
+    def group_has_liberty(self, c: int) -> bool:
+        """ does the group at c have at least one liberty?  Floods like
+        floodfill(), but in a visited set instead of a cloned buffer and
+        bailing out at the first empty point met, so live groups (the
+        overwhelmingly common case) are answered after a couple of
+        cells """
+        buf = self._buf
+        W = self.W
+        p = buf[c]
+        visited = {c}
+        cells = [c]
+        head = 0
+        while head < len(cells):
+            c = cells[head]
+            head += 1
+            for d in (c - 1, c + 1, c - W, c + W):
+                b = buf[d]
+                if b == 0x2e:  # '.'
+                    return True
+                if b == p and d not in visited:
+                    visited.add(d)
+                    cells.append(d)
+        return False
 
     def swapcase(self) -> "Board":
-        return Board(self.board.swapcase())
+        # pass sequences and re-evaluated pass moves flip the same board
+        # over and over; memoize the swapped twin, linked both ways so a
+        # double flip is free.  The twin is shared, which is safe because
+        # boards handed out of here are never mutated
+        board = self._swapped
+        if board is None:
+            board = Board._from_buf(bytearray(self._buf.translate(self._swapcase_table)))
+            if self._hash is not None:
+                board._hash = self._hash_swap
+                board._hash_swap = self._hash
+            board._swapped = self
+            self._swapped = board
+        return board
+
+    def _is_eyeish_byte(self, c: int) -> int:
+        """ byte-level core of is_eyeish(): the diamond color as a byte
+        value, or 0; both eye tests run per candidate move, so the scan
+        sticks to int compares with no chr/str conversions """
+        eyecolor = 0
+        buf = self._buf
+        for d in self.NEIGH[c]:
+            b = buf[d]
+            if b == 0x20 or b == 0x0a:  # border
+                continue
+            if b == 0x2e:  # '.'
+                return 0
+            if eyecolor == 0:
+                eyecolor = b
+                othercolor = b ^ 0x20  # case flip
+            elif b == othercolor:
+                return 0
+        return eyecolor
 
     def is_eyeish(self, c: int) -> Optional[str]:
         """ test if c is inside a single-color diamond and return the diamond
         color or None; this could be an eye, but also a false one """
-        eyecolor = None
-        for d in self.neighbors(c):
-            if self.board[d].isspace():
-                continue
-            if self.board[d] == '.':
-                return None
-            if eyecolor is None:
-                eyecolor = self.board[d]
-                othercolor = eyecolor.swapcase()
-            elif self.board[d] == othercolor:
-                return None
-        return eyecolor
+        eyecolor = self._is_eyeish_byte(c)
+        return chr(eyecolor) if eyecolor else None
 
     def is_eye(self, c: int) -> Optional[str]:
         """ test if c is an eye and return its color or None """
-        eyecolor = self.is_eyeish(c)
-        if eyecolor is None:
+        eyecolor = self._is_eyeish_byte(c)
+        if not eyecolor:
             return None
 
         # Eye-like shape, but it could be a falsified eye
-        falsecolor = eyecolor.swapcase()
+        falsecolor = eyecolor ^ 0x20
         false_count = 0
         at_edge = False
-        for d in self.diag_neighbors(c):
-            if self.board[d].isspace():
+        buf = self._buf
+        for d in self.DIAG[c]:
+            b = buf[d]
+            if b == 0x20 or b == 0x0a:
                 at_edge = True
-            elif self.board[d] == falsecolor:
+            elif b == falsecolor:
                 false_count += 1
         if at_edge:
             false_count += 1
         if false_count >= 2:
             return None
 
-        return eyecolor
+        return chr(eyecolor)
 
     def contact(self, p):
         """ test if point of color p is adjecent to color # anywhere
         on the board; use in conjunction with floodfill for reachability """
-        m = self.contact_res[p].search(self.board)
-        if not m:
+        cells = self._flood_cells
+        if cells is not None:
+            # when floodfill recorded the group, walking its perimeter
+            # beats building the occupancy masks (groups are small on
+            # this board size; see the mask path below for the rest)
+            buf = self._buf
+            pp = ord(p)
+            W = self.W
+            for i in cells:
+                for d in (i - 1, i + 1, i - W, i + W):
+                    if buf[d] == pp:
+                        return d
+            return None
+        group = self.occupancy_mask('#')
+        if not group:
+            return None
+        p_mask = self.occupancy_mask(p)
+        if not p_mask:
             return None
-        return m.start() if m.group(0)[0] == p else m.end() - 1
+        # expand the group one step in all four directions (one byte lane
+        # per point, so a point shift is a shift by 8) and intersect with
+        # the p occupancy; the border lanes are never set in p_mask, so
+        # shifts cannot produce false wrap-around contacts
+        w8 = 8 * self.W
+        adjacent = ((group << 8) | (group >> 8) | (group << w8) | (group >> w8)) & p_mask
+        if not adjacent:
+            return None
+        return ((adjacent & -adjacent).bit_length() - 1) // 8
 
     def board_put(self, c: int, p: str) -> Optional["Board"]:
         if c is None:
             return
-        try:
-            board = self.board[:c] + p + self.board[c + 1:]
-            return Board(board)
-        except Exception as e:
-            print(e)
-            raise
+        byteboard = bytearray(self._buf)
+        byteboard[c] = ord(p)
+        board = Board._from_buf(byteboard)
+        # a point write cannot change the '#' area, keep the bookkeeping
+        board._flood_cells = self._flood_cells
+        return board
 
     def empty_area(self, c: int, dist=3) -> bool:
         """ Check whether there are any stones in Manhattan distance up
         to dist """
-        for d in Board.neighbors(c):
-            if self.board[d] in 'Xx':
-                return False
-            elif self.board[d] == '.' and dist > 1 and not self.empty_area(d, dist - 1):
+        buf = self._buf
+        for d in Board.MANHATTAN_DISC[dist][c]:
+            b = buf[d]
+            if b == 0x58 or b == 0x78:  # 'X' / 'x'
                 return False
         return True
 
@@ -108,6 +374,12 @@ class Board:
         """ return probability of large-scale pattern at coordinate c.
         Multiple progressively wider patterns may match a single coordinate,
         we consider the largest one. """
+        cache = Board._large_pattern_cache
+        key = (self.board_hash(), c)
+        try:
+            return cache[key]
+        except KeyError:
+            pass
         probability = None
         matched_len = 0
         non_matched_len = 0
@@ -123,46 +395,68 @@ class Board:
                 break
             else:
                 non_matched_len = len(n)
+        if len(cache) >= self._LARGE_PATTERN_CACHE_SIZE:
+            cache.clear()
+        cache[key] = probability
         return probability
 
-    def neighborhood_gridcular(self, c: int) -> Generator[str, None, None]:
+    def neighborhood_gridcular(self, c: int) -> Generator[bytes, None, None]:
         """
         Yield progressively wider-diameter gridcular board neighborhood
-        stone configuration strings, in all possible rotations
-        Each rotations element is (xyindex, xymultiplier)
+        stone configurations as bytes, in all possible rotations
         """
-        rotations = [((0, 1), (1, 1)), ((0, 1), (-1, 1)), ((0, 1), (1, -1)), ((0, 1), (-1, -1)),
-                     ((1, 0), (1, 1)), ((1, 0), (-1, 1)), ((1, 0), (1, -1)), ((1, 0), (-1, -1))]
-        neighborhood = ['' for i in range(len(rotations))]
-        wboard = self.board.replace('\n', ' ')
-        for dseq in pat_gridcular_seq:
-            for ri in range(len(rotations)):
-                r = rotations[ri]
-                for o in dseq:
-                    y, x = divmod(c - (self.W + 1), self.W)
-                    y += o[r[0][0]] * r[1][0]
-                    x += o[r[0][1]] * r[1][1]
-                    if 0 <= y < self.N and self.N > x >= 0:
-                        neighborhood[ri] += wboard[(y + 1) * self.W + x + 1]
-                    else:
-                        neighborhood[ri] += ' '
+        # The padded view embeds the N*N points in a space border as wide
+        # as the largest gridcular diameter, so each point is a plain
+        # index delta from c with no bounds checks
+        pwboard = self._wboard
+        if pwboard is None:
+            pwboard = self._wboard = self._padded_board()
+        y, x = self.ROWCOL[c]
+        base = (y + self._GRIDCULAR_PAD) * self._PW + x + self._GRIDCULAR_PAD
+        neighborhood = [b'' for i in range(len(self._GRIDCULAR_OFFSETS[0]))]
+        for dseq_offsets in self._GRIDCULAR_OFFSETS:
+            for ri, offsets in enumerate(dseq_offsets):
+                neighborhood[ri] += bytes([pwboard[base + o] for o in offsets])
                 yield neighborhood[ri]
 
-    def neighborhood_33(self, c: int) -> str:
-        """ return a string containing the 9 points forming 3x3 square around
-        a certain move candidate """
-        return (self.board[c - self.W - 1: c - self.W + 2] +
-                self.board[c - 1: c + 2] + self.board[c + self.W - 1: c + self.W + 2]).replace('\n', ' ')
+    def _padded_board(self) -> bytes:
+        pad = self._GRIDCULAR_PAD
+        buf = self._buf
+        blank = self._PW * b' '
+        lines = pad * [blank]
+        for yy in range(self.N):
+            row_start = (yy + 1) * self.W + 1
+            lines.append(pad * b' ' + bytes(buf[row_start: row_start + self.N]) + pad * b' ')
+        lines += pad * [blank]
+        return b''.join(lines)
+
+    def neighborhood_33_code(self, c: int) -> int:
+        """ return the 9 points forming a 3x3 square around a certain move
+        candidate, packed row-major into an 18-bit int (2 bits per point,
+        same encoding as board_patterns.pat3_code).  The buffer never
+        mutates after construction (board_put clones), so codes are
+        memoized per Board: the heuristic windows of consecutive playout
+        steps overlap and re-query the same cells """
+        v = self._nh33_cache.get(c)
+        if v is None:
+            buf = self._buf
+            code = self._CELL_CODE
+            W = self.W
+            v = (code[buf[c - W - 1]] << 16 | code[buf[c - W]] << 14 | code[buf[c - W + 1]] << 12 |
+                 code[buf[c - 1]] << 10 | code[buf[c]] << 8 | code[buf[c + 1]] << 6 |
+                 code[buf[c + W - 1]] << 4 | code[buf[c + W]] << 2 | code[buf[c + W + 1]])
+            self._nh33_cache[c] = v
+        return v
 
     @classmethod
     def neighbors(cls, c: int):
-        """ generator of coordinates for all neighbors of c """
-        return [c - 1, c + 1, c - cls.W, c + cls.W]
+        """ coordinates of all neighbors of c """
+        return cls.NEIGH[c]
 
     @classmethod
     def diag_neighbors(cls, c: int) -> List[int]:
-        """ generator of coordinates for all diagonal neighbors of c """
-        return [c - cls.W - 1, c - cls.W + 1, c + cls.W - 1, c + cls.W + 1]
+        """ coordinates of all diagonal neighbors of c """
+        return cls.DIAG[c]
 
     @classmethod
     def parse_coord(cls, s: str) -> Optional[int]:
@@ -174,25 +468,72 @@ class Board:
     def str_coord(cls, c) -> str:
         if c is None:
             return 'pass'
-        row, col = divmod(c - (cls.W + 1), cls.W)
+        row, col = cls.ROWCOL[c]
         return f'{chr(col + ord("A"))}{cls.N - row}'
 
     @classmethod
     def line_height(cls, c: int) -> int:
         """ Return the line number above nearest board edge """
-        row, col = divmod(c - (cls.W + 1), cls.W)
-        return min(row, col, cls.N - 1 - row, cls.N - 1 - col)
+        return cls.LINE_HEIGHT[c]
+
+
+def contact_on(buf: bytearray, cells: List[int], p: int) -> Optional[int]:
+    """ Board.contact() over a raw flooded buffer: return a point with
+    byte value p adjacent to the flooded cells, or None """
+    W = Board.W
+    for i in cells:
+        for d in (i - 1, i + 1, i - W, i + W):
+            if buf[d] == p:
+                return d
+    return None
 
 
 def _initialize_board_statics():
-    for p in ['.', 'x', 'X']:
-        rp = '\\.' if p == '.' else p
-        contact_res_src = ['#' + rp,  # p at right
-                           rp + '#',  # p at left
-                           '#' + '.'*(Board.W-1) + rp,  # p below
-                           rp + '.'*(Board.W-1) + '#']  # p above
-        # ['#\\.', '\\.#', '#..............\\.', '\\...............#']
-        Board.contact_res[p] = re.compile('|'.join(contact_res_src), flags=re.DOTALL)
+    W, W2 = Board.W, Board.W2
+    # a private seeded generator keeps the engine's global RNG stream
+    # untouched and makes worker processes agree on the Zobrist keys
+    zob_rng = random.Random(0x6d696368)
+    Board._ZOB_X = tuple(zob_rng.getrandbits(64) for _ in range(W2))
+    Board._ZOB_x = tuple(zob_rng.getrandbits(64) for _ in range(W2))
+    Board.NEIGH = tuple((c - 1, c + 1, c - W, c + W) for c in range(W2))
+    Board.ROWCOL = tuple(divmod(c - (W + 1), W) for c in range(W2))
+    Board.LINE_HEIGHT = tuple(min(row, col, Board.N - 1 - row, Board.N - 1 - col)
+                              for row, col in Board.ROWCOL)
+    Board.DIAG = tuple((c - W - 1, c - W + 1, c + W - 1, c + W + 1) for c in range(W2))
+    Board.NEIGH9 = tuple((c,) + Board.NEIGH[c] + Board.DIAG[c] for c in range(W2))
+
+    for dist in (1, 2, 3):
+        table = []
+        for c in range(W2):
+            row, col = Board.ROWCOL[c]
+            if not (0 <= row < Board.N and 0 <= col < Board.N):
+                table.append(())
+                continue
+            table.append(tuple(
+                c + dy * W + dx
+                for dy in range(-dist, dist + 1) for dx in range(-dist, dist + 1)
+                if 0 < abs(dy) + abs(dx) <= dist
+                and 0 <= row + dy < Board.N and 0 <= col + dx < Board.N))
+        Board.MANHATTAN_DISC[dist] = tuple(table)
+
+    for p in '.xX#L% \n':
+        Board._mask_tables[p] = bytes(1 if i == ord(p) else 0 for i in range(256))
+
+    Board._CELL_CODE = tuple(
+        pat3_cell_codes.get(chr(i), pat3_cell_codes[' ']) for i in range(256))
+
+    # Each rotations element is (swap_xy, y_sign, x_sign)
+    rotations = [(swap, sy, sx) for swap in (False, True) for sx in (1, -1) for sy in (1, -1)]
+    start = 0
+    offsets = []
+    for end in pat_gridcular_diam_ends:
+        offsets.append(tuple(
+            tuple(((pat_gridcular_dxs[k] if swap else pat_gridcular_dys[k]) * sy * Board._PW +
+                   (pat_gridcular_dys[k] if swap else pat_gridcular_dxs[k]) * sx)
+                  for k in range(start, end))
+            for swap, sy, sx in rotations))
+        start = end
+    Board._GRIDCULAR_OFFSETS = tuple(offsets)
 
 
 _initialize_board_statics()
@@ -84,4 +84,17 @@ def pat3_expand(pat):
             for p in pat_wildcards(''.join(p))]
 
 
-pat3set = set([p.replace('O', 'x') for p in pat3src for p in pat3_expand(p)])
+# cell character -> 2-bit code used to pack a 3x3 neighborhood into one
+# 18-bit int; must agree with Board.neighborhood_33_code()
+pat3_cell_codes = {'.': 0, 'X': 1, 'x': 2, ' ': 3}
+
+
+def pat3_code(pat: str) -> int:
+    """ pack a 9-char 3x3 pattern string into its 18-bit int form """
+    code = 0
+    for ch in pat:
+        code = code << 2 | pat3_cell_codes[ch]
+    return code
+
+
+pat3set = frozenset(pat3_code(p.replace('O', 'x')) for pat in pat3src for p in pat3_expand(pat))
@@ -19,6 +19,14 @@ pat_gridcular_seq = [
         [[0,7], [0,-7], [2,6], [-2,6], [2,-6], [-2,-6], [4,5], [-4,5], [4,-5], [-4,-5], [5,4], [-5,4], [5,-4], [-5,-4], [6,2], [-6,2], [6,-2], [-6,-2], [7,0], [-7,0], ],
     ]
 
+# Flattened view of pat_gridcular_seq: parallel dy/dx tuples plus the
+# cumulative end index of each diameter, so consumers iterate a flat
+# range instead of nested per-diameter tuple indexing
+pat_gridcular_dys = tuple(dy for dseq in pat_gridcular_seq for dy, dx in dseq)
+pat_gridcular_dxs = tuple(dx for dseq in pat_gridcular_seq for dy, dx in dseq)
+pat_gridcular_diam_ends = tuple(
+    sum(len(dseq) for dseq in pat_gridcular_seq[:i + 1]) for i in range(len(pat_gridcular_seq)))
+
 PROB_HEURISTIC = {'capture': 0.9, 'pat3': 0.95}  # probability of heuristic suggestions being taken in playout
 PROB_SSAREJECT = 0.9  # probability of rejecting suggested self-atari in playout
 PROB_RSAREJECT = 0.5  # probability of rejecting random self-atari in playout; this is lower than above to allow nakade
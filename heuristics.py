@@ -1,18 +1,56 @@
 import random
 import sys
+from array import array
 from typing import Optional, Tuple, List, Any, Dict, Generator, Iterable
 
-from board import Board
+from board import Board, contact_on
 from board_patterns import pat3set
 from const import PROB_HEURISTIC, PROB_RSAREJECT, PROB_SSAREJECT
 from position import Position
 
 
+# fix_atari results for positions revisited during tree descent, keyed by
+# (board_hash, ko, c, flags); cleared at the start of each tree search and
+# bounded by wholesale clearing.  Only every third miss is admitted -
+# most playout positions are never seen twice and admitting them all
+# just churns the dict
+_fix_atari_cache = dict()
+_fix_atari_misses = 0
+_FIX_ATARI_CACHE_SIZE = 64 * 1024
+
+
+def clear_fix_atari_cache() -> None:
+    _fix_atari_cache.clear()
+
+
 def fix_atari(pos: Position,
               c: int,
               singlept_ok=False,
               twolib_test=True,
               twolib_edgeonly=False) -> Optional[Tuple[bool, List[Any]]]:
+    """ Memoizing wrapper of _fix_atari_uncached(); the analysis is
+    deterministic in the position, so repeated queries (recursive ladder
+    reading, prioring of sibling nodes) are served from the cache.
+    Callers may mutate the returned move list freely. """
+    global _fix_atari_misses
+    key = (pos.board.board_hash(), pos.ko, c, singlept_ok, twolib_test, twolib_edgeonly)
+    cached = _fix_atari_cache.get(key)
+    if cached is not None:
+        return cached[0], list(cached[1])
+    in_atari, ds = _fix_atari_uncached(pos, c, singlept_ok, twolib_test, twolib_edgeonly)
+    _fix_atari_misses += 1
+    if _fix_atari_misses % 3 == 0:
+        if len(_fix_atari_cache) >= _FIX_ATARI_CACHE_SIZE:
+            _fix_atari_cache.clear()
+        _fix_atari_cache[key] = (in_atari, tuple(ds))
+    return in_atari, ds
+
+
+def _fix_atari_uncached(pos: Position,
+                        c: int,
+                        singlept_ok=False,
+                        twolib_test=True,
+                        twolib_edgeonly=False) -> Optional[Tuple[bool, List[Any]]]:
     """ An atari/capture analysis routine that checks the group at c,
     determining whether (i) it is in atari (ii) if it can escape it,
     either by playing on its liberty or counter-capturing another group.
@@ -49,21 +87,18 @@ def fix_atari(pos: Position,
                 return l
         return None
 
-    fboard = pos.board.floodfill(c)
-    group_size = fboard.board.count('#')
+    # One fused pass floods the group and finds its first liberties
+    fbuf, fcells, libs = pos.board.floodfill_libs(c)
+    group_size = len(fcells)
     if singlept_ok and group_size == 1:
         return False, []
-    # Find a liberty
-    l = fboard.contact('.')
-    # Ok, any other liberty?
-    fboard = fboard.board_put(l, 'L')
-    l2 = fboard.contact('.')
-    if l2 is not None:
+    l = libs[0]
+    if len(libs) > 1:
         # At least two liberty group...
+        l2 = libs[1]
         if twolib_test and group_size > 1 \
-                and (not twolib_edgeonly or Board.line_height(l) == 0 and Board.line_height(l2) == 0):
-            l_board = fboard.board_put(l2, 'L')
-            if l_board.contact('.') is None:
+                and (not twolib_edgeonly or Board.LINE_HEIGHT[l] == 0 and Board.LINE_HEIGHT[l2] == 0):
+            if len(libs) == 2:
                 # Exactly two liberty group with more than one stone.  Check
                 # that it cannot be caught in a working ladder; if it can,
                 # that's as good as in atari, a capture threat.
@@ -74,23 +109,22 @@ def fix_atari(pos: Position,
         return False, []
 
     # In atari! If it's the opponent's group, that's enough...
-    if pos.board.board[c] == 'x':
+    if pos.board._buf[c] == 0x78:  # 'x'
         return True, [l]
 
     solutions = []
 
     # Before thinking about defense, what about counter-capturing
     # a neighboring group?
-    counter_capt_board = Board(fboard.board)
     while True:
-        othergroup = counter_capt_board.contact('x')
+        othergroup = contact_on(fbuf, fcells, 0x78)
         if othergroup is None:
             break
         a, ccls = fix_atari(pos, othergroup, twolib_test=False)
         if a and ccls:
             solutions += ccls
         # XXX: floodfill is better for big groups
-        counter_capt_board = counter_capt_board.board_put(othergroup, '%')
+        fbuf[othergroup] = 0x25  # '%'
 
     # We are escaping.  Will playing our last liberty gain
     # at least two liberties?  Re-floodfill to account for connecting
@@ -98,43 +132,52 @@ def fix_atari(pos: Position,
     if escpos is None:
         return True, solutions  # oops, suicidal move
 
-    fboard = escpos.board.floodfill(l)
-    l_new = fboard.contact('.')
-    fboard = fboard.board_put(l_new, 'L')
-    l_new_2 = fboard.contact('.')
-    if l_new_2 is not None:
+    fbuf, fcells, libs = escpos.board.floodfill_libs(l)
+    if len(libs) > 1:
         # Good, there is still some liberty remaining - but if it's
         # just the two, check that we are not caught in a ladder...
         # (Except that we don't care if we already have some alternative
         # escape routes!)
-        if solutions or not (fboard.board_put(l_new_2, 'L').contact('.') is None
-                             and read_ladder_attack(escpos, l, l_new, l_new_2) is not None):
+        if solutions or not (len(libs) == 2
+                             and read_ladder_attack(escpos, l, libs[0], libs[1]) is not None):
             solutions.append(l)
 
     return True, solutions
 
 
+_CFG_MAP_TEMPLATE = array('h', Board.W2 * [-1])
+
+
 def cfg_distances(board: Board, c: int) -> List[int]:
     """ return a board map listing common fate graph distances from
     a given point - this corresponds to the concept of locality while
     contracting groups to single points """
-    cfg_map = board.W2 * [-1]
+    cfg_map = array('h', _CFG_MAP_TEMPLATE)
     cfg_map[c] = 0
+    buf = board._buf
+    neigh = Board.NEIGH
 
-    # flood-fill like mechanics
-    fringe = [c]
-    while fringe:
-        c = fringe.pop()
-        for d in Board.neighbors(c):
-            if board.board[d].isspace() or 0 <= cfg_map[d] <= cfg_map[c]:
+    # flood-fill like mechanics; a head-indexed BFS queue keeps the
+    # relaxation front ordered so cells are rarely re-queued
+    queue = [c]
+    head = 0
+    while head < len(queue):
+        c = queue[head]
+        head += 1
+        dist_c = cfg_map[c]
+        color_c = buf[c]
+        for d in neigh[c]:
+            color_d = buf[d]
+            if color_d == 0x20 or color_d == 0x0a or 0 <= cfg_map[d] <= dist_c:
                 continue
             cfg_before = cfg_map[d]
-            if board.board[d] != '.' and board.board[d] == board.board[c]:
-                cfg_map[d] = cfg_map[c]
+            if color_d != 0x2e and color_d == color_c:  # same-color stones
+                dist_d = dist_c
             else:
-                cfg_map[d] = cfg_map[c] + 1
-            if cfg_before < 0 or cfg_before > cfg_map[d]:
-                fringe.append(d)
+                dist_d = dist_c + 1
+            cfg_map[d] = dist_d
+            if cfg_before < 0 or cfg_before > dist_d:
+                queue.append(d)
     return cfg_map
 
 
@@ -152,32 +195,46 @@ def gen_playout_moves(
 
     heuristic_set is the set of coordinates considered for applying heuristics;
     this is the immediate neighborhood of last two moves in the playout, but
-    the whole board while prioring the tree. """
+    the whole board while prioring the tree.
+
+    Note the laziness is load-bearing: mcplayout() usually accepts one of
+    the first suggestions, so eagerly materializing the capture/pat3
+    slices (tried, ~25% slower playouts) would run fix_atari and the
+    pattern matcher on cells whose turn never comes.  Duplicates are
+    instead weeded with a W*W seen bytearray rather than Python sets. """
 
     # Check whether any local group is in atari and fill that liberty
     # print('local moves', [str_coord(c) for c in heuristic_set], file=sys.stderr)
     if probs is None:
         probs = {'capture': 1, 'pat3': 1}
 
+    buf = pos.board._buf
     if random.random() <= probs['capture']:
-        already_suggested = set()
+        seen = bytearray(Board.W2)
         for c in heuristic_set:
-            if pos.board.board[c] in 'Xx':
+            if buf[c] in b'Xx':
                 in_atari, ds = fix_atari(pos, c, twolib_edgeonly=not expensive_ok)
-                random.shuffle(ds)
+                # ds is almost always 0-2 moves long; a coin flip beats
+                # the full Fisher-Yates machinery there
+                if len(ds) == 2:
+                    if random.random() < 0.5:
+                        ds.reverse()
+                elif len(ds) > 2:
+                    random.shuffle(ds)
+                kind = 'capture ' + str(c)
                 for d in ds:
-                    if d not in already_suggested:
-                        yield d, 'capture ' + str(c)
-                        already_suggested.add(d)
+                    if not seen[d]:
+                        yield d, kind
+                        seen[d] = 1
 
     # Try to apply a 3x3 pattern on the local neighborhood
     if random.random() <= probs['pat3']:
-        already_suggested = set()
+        seen = bytearray(Board.W2)
         for c in heuristic_set:
-            if pos.board.board[c] == '.' and c not in already_suggested \
-                    and pos.board.neighborhood_33(c) in pat3set:
+            if buf[c] == 0x2e and not seen[c] \
+                    and pos.board.neighborhood_33_code(c) in pat3set:
                 yield c, 'pat3'
-                already_suggested.add(c)
+                seen[c] = 1
 
     # Try *all* available moves, but starting from a random point
     # (in other words, suggest a random move)
@@ -197,7 +254,16 @@ def mcplayout(pos: Position, amaf_map, disp=False):
 
     start_n = pos.n
     passes = 0
-    while passes < 2 and pos.n < Board.MAX_GAME_LEN:
+    # hoist globals touched on every playout step into locals; short of
+    # compiling this loop out of the interpreter, trimming its dispatch
+    # overhead is the available lever
+    rand = random.random
+    gen_moves = gen_playout_moves
+    self_atari_test = fix_atari
+    prob_heuristic = PROB_HEURISTIC
+    prob_ssareject, prob_rsareject = PROB_SSAREJECT, PROB_RSAREJECT
+    max_game_len = Board.MAX_GAME_LEN
+    while passes < 2 and pos.n < max_game_len:
         if disp:
             pos.print_pos()
 
@@ -205,15 +271,15 @@ def mcplayout(pos: Position, amaf_map, disp=False):
         # We simply try the moves our heuristics generate, in a particular
         # order, but not with 100% probability; this is on the border between
         # "rule-based playouts" and "probability distribution playouts".
-        for c, kind in gen_playout_moves(pos, pos.last_moves_neighbors(), PROB_HEURISTIC):
+        for c, kind in gen_moves(pos, pos.last_moves_neighbors(), prob_heuristic):
             if disp and kind != 'random':
                 print('move suggestion', Board.str_coord(c), kind, file=sys.stderr)
             pos2 = pos.move(c)
             if pos2 is None:
                 continue
             # check if the suggested move did not turn out to be a self-atari
-            if random.random() <= (PROB_RSAREJECT if kind == 'random' else PROB_SSAREJECT):
-                in_atari, ds = fix_atari(pos2, c, singlept_ok=True, twolib_edgeonly=True)
+            if rand() <= (prob_rsareject if kind == 'random' else prob_ssareject):
+                in_atari, ds = self_atari_test(pos2, c, singlept_ok=True, twolib_edgeonly=True)
                 if ds:
                     if disp:
                         print('rejecting self-atari move', Board.str_coord(c), file=sys.stderr)
@@ -229,7 +295,7 @@ def mcplayout(pos: Position, amaf_map, disp=False):
         passes = 0
         pos = pos2
 
-    owner_map = Board.W * Board.W * [0]
+    owner_map = array('b', bytes(Board.W2))
     score = pos.score(owner_map)
     if disp:
         print('** SCORE B%+.1f **' % (score if pos.n % 2 == 0 else -score), file=sys.stderr)
@@ -35,6 +35,7 @@ import multiprocessing
 import re
 import sys
 import time
+from array import array
 from past.builtins import raw_input
 
 from board import Board
@@ -53,7 +54,7 @@ def mcbenchmark(n):
     # run n Monte-Carlo playouts from empty position, return avg. score
     sumscore = 0
     for i in range(0, n):
-        sumscore += mcplayout(empty_position(), Board.W2 * [0])[0]
+        sumscore += mcplayout(empty_position(), array('b', bytes(Board.W2)))[0]
     return float(sumscore) / n
 
 
@@ -234,7 +235,7 @@ if __name__ == "__main__":
     elif sys.argv[1] == "gtp":
         gtp_io()
     elif sys.argv[1] == "mcdebug":
-        print(mcplayout(empty_position(), Board.W2*[0], disp=True)[0])
+        print(mcplayout(empty_position(), array('b', bytes(Board.W2)), disp=True)[0])
     elif sys.argv[1] == "mcbenchmark":
         print(mcbenchmark(20))
     elif sys.argv[1] == "tsbenchmark":
@@ -34,36 +34,55 @@ class Position:
         if c == self.komi:
             return None
         # Are we trying to play in enemy's eye?
-        in_enemy_eye = self.board.is_eyeish(c) == 'x'
-        board = self.board.board_put(c, 'X')
+        in_enemy_eye = self.board._is_eyeish_byte(c) == 0x78  # 'x'
+        # A single translate pass builds the successor board already
+        # from the opponent's perspective; the new stone and any
+        # captures are then patched into that private buffer, so one
+        # buffer clone and one Board serve the whole move instead of
+        # the old put/capture/swapcase chain of copies
+        board = Board._from_buf(bytearray(self.board._buf.translate(Board._swapcase_table)))
+        buf = board._buf
+        buf[c] = 0x78  # our 'X', post-swap 'x'
+        # thread the Zobrist hash through incrementally: start from the
+        # parent pair, stir in the new stone, captures join below
+        zh = self.board.board_hash() ^ Board._ZOB_X[c]
+        zs = self.board._hash_swap ^ Board._ZOB_x[c]
 
-        # Test for captures, and track ko
+        # Test for captures, and track ko; the enemy reads 'X' post-swap
         capt_X = self.captures[0]
         singlecaps = []
-        for d in Board.neighbors(c):
-            if board.board[d] != 'x':
+        for d in Board.NEIGH[c]:
+            if buf[d] != 0x58:  # 'X'
+                continue
+            # the liberty query floods the group in place and bails out
+            # at the first empty point met, so live neighbor groups cost
+            # a couple of cells instead of a full clone-and-flood; a
+            # group captured by this stone already had its lone liberty
+            # at c, so a same-group second neighbor re-checks as '.'
+            if board.group_has_liberty(d):
                 continue
-            # XXX: The following is an extremely naive and SLOW approach
-            # at things - to do it properly, we should maintain some per-group
-            # data structures tracking liberties.
-            fboard = board.floodfill(d)  # get a board with the adjecent group replaced by '#'
-            if fboard.contact('.') is not None:
-                continue  # some liberties left
             # no liberties left for this group, remove the stones!
-            capcount = fboard.board.count('#')
+            _, fcells = board.floodfill_into(d)
+            capcount = len(fcells)
             if capcount == 1:
                 singlecaps.append(d)
             capt_X += capcount
-            board.board = fboard.board.replace('#', '.')  # capture the group
+            for e in fcells:  # capture the group
+                buf[e] = 0x2e  # '.'
+                zh ^= Board._ZOB_x[e]  # captured stones were 'x' pre-swap
+                zs ^= Board._ZOB_X[e]
         # Set ko
         ko = singlecaps[0] if in_enemy_eye and len(singlecaps) == 1 else None
         # Test for suicide
-        sfboard = board.floodfill(c)
-        if sfboard.contact('.') is None:
+        if not board.group_has_liberty(c):
             return None
+        # the successor board is in the swapped frame, so the pair trades
+        # places
+        board._hash = zs
+        board._hash_swap = zh
 
         # Update the position and return
-        return Position(board=board.swapcase(), captures=(self.captures[1], capt_X),
+        return Position(board=board, captures=(self.captures[1], capt_X),
                         n=self.n + 1, ko=ko, last=c, last2=self.last, komi=self.komi)
 
     def pass_move(self):
@@ -77,8 +96,12 @@ class Position:
         index (that can be used for randomization) """
         i = i0-1
         passes = 0
+        # scan the byte buffer directly - going through the .board str
+        # view would force a decode of the whole buffer just to find()
+        # vacant points
+        buf = self.board._buf
         while True:
-            i = self.board.board.find('.', i+1)
+            i = buf.find(0x2e, i+1)  # '.'
             if passes > 0 and (i == -1 or i >= i0):
                 break  # we have looked through the whole board
             elif i == -1:
@@ -97,12 +120,16 @@ class Position:
         priority)
         """
         coord_list = []
+        seen = set()
         for c in self.last, self.last2:
             if c is None:
                 continue
-            diag_list = [c] + list(Board.neighbors(c) + Board.diag_neighbors(c))
+            diag_list = list(Board.NEIGH9[c])
             random.shuffle(diag_list)
-            coord_list += [d for d in diag_list if d not in coord_list]
+            for d in diag_list:
+                if d not in seen:
+                    seen.add(d)
+                    coord_list.append(d)
         return coord_list
 
     def score(self, owner_map: Optional[List[int]] = None):
@@ -110,29 +137,35 @@ class Position:
         with all dead stones captured; if owner_map is passed, it is assumed
         to be an array of statistics with average owner at the end of the game
         (+1 black, -1 white) """
-        board = self.board
+        # label each empty region in a single working copy of the
+        # buffer; scanning that same copy for the next '.' means every
+        # region is flooded and labelled exactly once
+        fb = bytearray(self.board._buf)
         i = 0
         while True:
-            i = self.board.board.find('.', i+1)
+            i = fb.find(0x2e, i+1)  # '.'
             if i == -1:
                 break
-            fboard = self.board.floodfill(i)
-            # fboard is board with some continuous area of empty space replaced by #
-            touches_X = fboard.contact('X') is not None
-            touches_x = fboard.contact('x') is not None
+            cells, touches_X, touches_x = self.board.floodfill_reaches(i)
             if touches_X and not touches_x:
-                board = fboard.board.replace('#', 'X')
+                label = 0x58  # 'X'
             elif touches_x and not touches_X:
-                board = fboard.board.replace('#', 'x')
+                label = 0x78  # 'x'
             else:
-                board = fboard.board.replace('#', ':')  # seki, rare
+                label = 0x3a  # ':', seki, rare
+            for e in cells:
+                fb[e] = label
             # now that area is replaced either by X, x or :
         komi = self.komi if self.n % 2 == 1 else -self.komi
         if owner_map is not None:
-            for c in range(self.board.W * self.board.W):
-                n = 1 if board[c] == 'X' else -1 if board[c] == 'x' else 0
-                owner_map[c] += n * (1 if self.n % 2 == 0 else -1)
-        return board.count('X') - board.count('x') + komi
+            sign = 1 if self.n % 2 == 0 else -1
+            for c in range(Board.W2):
+                b = fb[c]
+                if b == 0x58:
+                    owner_map[c] += sign
+                elif b == 0x78:
+                    owner_map[c] -= sign
+        return fb.count(0x58) - fb.count(0x78) + komi
 
     def print_pos(self, f=sys.stderr, owner_map=None) -> None:
         """ print visualization of the given board position, optionally also
@@ -177,4 +210,4 @@ class Position:
 
 def empty_position() -> Position:
     # Return an initial board position
-    return Position(board=Board(), captures=(0, 0), n=0, ko=None, last=None, last2=None, komi=7.5)
+    return Position(board=Board.fresh(), captures=(0, 0), n=0, ko=None, last=None, last2=None, komi=7.5)
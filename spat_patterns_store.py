@@ -1,17 +1,25 @@
 class SpatialPatternsStore:
     spat_patterndict_file = 'patterns.spat'
+    # '#' (out of board) -> ' ', 'O' (opponent) -> 'x', one translate pass
+    _neigh_trans = str.maketrans('#O', ' x')
 
     def __init__(self):
         self.spat_patterndict = dict()  # hash(neighborhood_gridcular()) -> spatial id
 
     def load_spat_patterndict(self, f):
         """ load dictionary of positions, translating them to numeric ids """
-        for line in f:
+        patterndict = self.spat_patterndict
+        trans = self._neigh_trans
+        for line in f.read().splitlines():
             # line: 71 6 ..X.X..OO.O..........#X...... 33408f5e 188e9d3e 2166befe aa8ac9e 127e583e 1282462e 5e3d7fe 51fc9ee
             if line.startswith('#'):
                 continue
-            neighborhood = line.split()[2].replace('#', ' ').replace('O', 'x')
-            self.spat_patterndict[hash(neighborhood)] = int(line.split()[0])
+            # only the id and the neighborhood columns matter, so the
+            # split stops after them instead of cutting up the hash tail;
+            # keys are hashed in the bytes domain to match the raw-buffer
+            # neighborhoods produced by Board.neighborhood_gridcular()
+            fields = line.split(None, 3)
+            patterndict[hash(fields[2].translate(trans).encode('ascii'))] = int(fields[0])
 
 
 spatial_pattern_store = SpatialPatternsStore()
@@ -1,11 +1,13 @@
 import multiprocessing
+import queue
 import random
 import sys
+from array import array
 from typing import List
 
 from board import Board
 from const import EXPAND_VISITS, REPORT_PERIOD, FASTPLAY5_THRES, FASTPLAY20_THRES
-from heuristics import mcplayout
+from heuristics import mcplayout, clear_fix_atari_cache
 from tree_node import TreeNode
 from ui import dump_subtree, print_tree_summary
 
@@ -22,6 +24,16 @@ PRIOR_EMPTYAREA = 10
 worker_pool = None
 
 
+def _init_worker():
+    """ pool initializer, run in each worker right after fork.  The
+    pattern stores are loaded in the parent before the first search, so
+    fork's copy-on-write pages hand them to the workers without any
+    per-task pickling; all the worker itself needs is its own RNG
+    stream, as forked children otherwise replay the parent's state in
+    lockstep """
+    random.seed()
+
+
 def tree_descend(tree: TreeNode, amaf_map, disp=False):
     """ Descend through the tree to a leaf """
     tree.v += 1
@@ -31,13 +43,23 @@ def tree_descend(tree: TreeNode, amaf_map, disp=False):
         if disp:
             nodes[-1].pos.print_pos()
 
-        # Pick the most urgent child
-        children = list(nodes[-1].children)
+        # Pick the most urgent child; ties are broken uniformly by
+        # reservoir sampling, so the common no-tie scan costs no RNG
+        # call and no shuffled copy of the children list
         if disp:
-            for c in children:
+            for c in nodes[-1].children:
                 dump_subtree(c, recurse=False)
-        random.shuffle(children)  # randomize the max in case of equal urgency
-        node = max(children, key=lambda node: node.rave_urgency())
+        node = None
+        best_urgency = float('-inf')
+        ties = 1
+        for child in nodes[-1].children:
+            urgency = child.rave_urgency()
+            if urgency > best_urgency:
+                best_urgency, node, ties = urgency, child, 1
+            elif urgency == best_urgency:
+                ties += 1
+                if random.random() < 1.0 / ties:
+                    node = child
         nodes.append(node)
 
         if disp:
@@ -67,11 +89,9 @@ def tree_update(nodes: List[TreeNode], amaf_map, score, disp=False) -> None:
         # with their color
         amaf_map_value = 1 if node.pos.n % 2 == 0 else -1
         if node.children is not None:
-            for child in node.children:
-                if child.pos.last is None:
-                    continue
-                if amaf_map[child.pos.last] == amaf_map_value:
-                    if disp:  print('  AMAF updating', Board.str_coord(child.pos.last), score > 0, file=sys.stderr)
+            for child_last, child in node._amaf_children:
+                if amaf_map[child_last] == amaf_map_value:
+                    if disp:  print('  AMAF updating', Board.str_coord(child_last), score > 0, file=sys.stderr)
                     child.aw += score > 0  # reversed perspective
                     child.av += 1
         score = -score
@@ -79,6 +99,8 @@ def tree_update(nodes: List[TreeNode], amaf_map, score, disp=False) -> None:
 
 def tree_search(tree: TreeNode, n, owner_map, disp=False):
     """ Perform MCTS search from a given position for a given #iterations """
+    # The memoized atari analysis is only valid within one search
+    clear_fix_atari_cache()
     # Initialize root node
     if tree.children is None:
         tree.expand()
@@ -97,56 +119,59 @@ def tree_search(tree: TreeNode, n, owner_map, disp=False):
     n_workers = multiprocessing.cpu_count() if not disp else 1  # set to 1 when debugging
     global worker_pool
     if worker_pool is None:
-        worker_pool = multiprocessing.Pool(processes=n_workers)
-    outgoing = []  # positions waiting for a playout
-    incoming = []  # positions that finished evaluation
-    ongoing = []  # currently ongoing playout jobs
+        worker_pool = multiprocessing.Pool(processes=n_workers, initializer=_init_worker)
+    # Finished playouts arrive through a callback queue filled by the
+    # pool's result thread, so the master blocks on an actual completion
+    # instead of polling job.ready() with a fixed-timeout wait()
+    finished = queue.Queue()
+    ongoing = 0  # playout jobs currently in flight
+    owner_maps = []  # per-playout owner maps, folded together at the end
     i = 0
     while i < n:
-        if not outgoing and not (disp and ongoing):
-            # Descend the tree so that we have something ready when a worker
-            # stops being busy
-            amaf_map = Board.W * Board.W * [0]
-            nodes = tree_descend(tree, amaf_map, disp=disp)
-            outgoing.append((nodes, amaf_map))
-
-        if len(ongoing) >= n_workers:
-            # Too many playouts running? Wait a bit...
-            ongoing[0][0].wait(0.01 / n_workers)
-        else:
+        # Keep every worker busy with a freshly descended position; the
+        # virtual loss applied on the way down keeps parallel descents
+        # from piling onto one path
+        while ongoing < n_workers and i < n:
             i += 1
-            if i > 0 and i % REPORT_PERIOD == 0:
+            if i % REPORT_PERIOD == 0:
                 print_tree_summary(tree, i, f=sys.stderr)
-
-            # Issue an mcplayout job to the worker pool
-            nodes, amaf_map = outgoing.pop()
-            ongoing.append((worker_pool.apply_async(mcplayout, (nodes[-1].pos, amaf_map, disp)), nodes))
-
-        # Anything to store in the tree?  (We do this step out-of-order
-        # picking up data from the previous round so that we don't stall
-        # ready workers while we update the tree.)
-        while incoming:
-            score, amaf_map, owner_map_one, nodes = incoming.pop()
+            amaf_map = array('b', bytes(Board.W2))
+            nodes = tree_descend(tree, amaf_map, disp=disp)
+            worker_pool.apply_async(
+                mcplayout, (nodes[-1].pos, amaf_map, disp),
+                callback=lambda result, nodes=nodes: finished.put((result, nodes)),
+                error_callback=finished.put)
+            ongoing += 1
+
+        # Block for the first completion, then drain whatever else is
+        # already in; updating the tree between refills keeps ready
+        # workers from stalling
+        item = finished.get()
+        while True:
+            if isinstance(item, BaseException):
+                raise item
+            (score, amaf_map, owner_map_one), nodes = item
             tree_update(nodes, amaf_map, score, disp=disp)
-            for c in range(Board.W * Board.W):
-                owner_map[c] += owner_map_one[c]
-
-        # Any playouts are finished yet?
-        for job, nodes in ongoing:
-            if not job.ready():
-                continue
-            # Yes! Queue them up for storing in the tree.
-            score, amaf_map, owner_map_one = job.get()
-            incoming.append((score, amaf_map, owner_map_one, nodes))
-            ongoing.remove((job, nodes))
+            # owner maps are just collected here; summing them cell by
+            # cell per playout would cost a W2 pass each time, so the
+            # whole pile is folded once after the loop
+            owner_maps.append(owner_map_one)
+            ongoing -= 1
+            try:
+                item = finished.get_nowait()
+            except queue.Empty:
+                break
 
         # Early stop test
         best_wr = tree.best_move().winrate()
         if i > n*0.05 and best_wr > FASTPLAY5_THRES or i > n*0.2 and best_wr > FASTPLAY20_THRES:
             break
 
-    for c in range(Board.W * Board.W):
-        owner_map[c] = float(owner_map[c]) / i
+    # fold all collected playout maps in one transposing pass and
+    # normalize; zip iterates the array('b') buffers at C level
+    if owner_maps:
+        owner_map[:] = [float(total + sum(ones)) / i
+                        for total, ones in zip(owner_map, zip(*owner_maps))]
     dump_subtree(tree)
     print_tree_summary(tree, i, f=sys.stderr)
     return tree.best_move()
@@ -26,6 +26,12 @@ class TreeNode:
     pv, pw are prior values (node value = w/v + pw/pv)
     av, aw are amaf values ("all moves as first", used for the RAVE tree policy)
     children is None for leaf nodes """
+    # a search allocates hundreds of thousands of nodes; slots shed the
+    # per-instance __dict__
+    __slots__ = ('pos', 'v', 'w', 'pv', 'pw', 'av', 'aw', 'children',
+                 '_amaf_children', '_urg', '_urg_sig', '_priors_done',
+                 '_prior_parent_pos')
+
     def __init__(self, pos: Position):
         self.pos = pos
         self.v = 0
@@ -35,12 +41,26 @@ class TreeNode:
         self.av = 0
         self.aw = 0
         self.children = None
+        # (move coord, child) pairs for the AMAF pass in tree_update,
+        # precomputed at expand time
+        self._amaf_children = None
+        # memoized rave_urgency() with the stats it was computed from;
+        # most children's stats are unchanged between descents
+        self._urg = 0.0
+        self._urg_sig = None
+        # expand() defers the expensive priors (atari analysis, large
+        # patterns) until a node proves worth revisiting
+        self._priors_done = True
+        self._prior_parent_pos = None
 
     def expand(self):
         """ add and initialize children to a leaf node """
         cfg_map = cfg_distances(self.pos.board, self.pos.last) if self.pos.last is not None else None
         self.children = []
-        childset = dict()
+        # children indexed by their move coordinate; a flat board-sized
+        # list beats dict hashing and the KeyError path for the per-
+        # candidate dedupe lookup
+        childset = Board.W2 * [None]
         # Use playout generator to generate children and initialize them
         # with some priors to bias search towards more sensible moves.
         # Note that there can be many ways to incorporate the priors in
@@ -51,9 +71,8 @@ class TreeNode:
                 continue
             # gen_playout_moves() will generate duplicate suggestions
             # if a move is yielded by multiple heuristics
-            try:
-                node = childset[pos2.last]
-            except KeyError:
+            node = childset[pos2.last]
+            if node is None:
                 node = TreeNode(pos2)
                 self.children.append(node)
                 childset[pos2.last] = node
@@ -90,29 +109,64 @@ class TreeNode:
                     node.pv += PRIOR_EMPTYAREA
                     node.pw += PRIOR_EMPTYAREA
 
-            in_atari, ds = fix_atari(node.pos, c, singlept_ok=True)
-            if ds:
-                node.pv += PRIOR_SELFATARI
-                node.pw += 0  # negative prior
-
-            patternprob = self.pos.board.large_pattern_probability(c)
-            if patternprob is not None and patternprob > 0.001:
-                pattern_prior = math.sqrt(patternprob)  # tone up
-                node.pv += pattern_prior * PRIOR_LARGEPATTERN
-                node.pw += pattern_prior * PRIOR_LARGEPATTERN
+            # The atari analysis and the large-pattern match are by far
+            # the costliest priors, and at EXPAND_VISITS most children
+            # are never descended again; defer them until the child
+            # attracts a second visit (see rave_urgency)
+            node._priors_done = False
+            node._prior_parent_pos = self.pos
 
         if not self.children:
             # No possible moves, add a pass move
             self.children.append(TreeNode(self.pos.pass_move()))
 
+        # the AMAF pass in tree_update touches every child of every node
+        # on the path after each playout; pairing each child with its
+        # move coordinate once here spares that loop the pos.last
+        # attribute chase and the pass-move test per child per update
+        self._amaf_children = tuple(
+            (child.pos.last, child) for child in self.children
+            if child.pos.last is not None)
+
+    def _apply_expensive_priors(self):
+        """ deferred tail of expand()'s prior pass, run once a node
+        attracts enough visits to matter """
+        parent_pos = self._prior_parent_pos
+        self._prior_parent_pos = None
+        self._priors_done = True
+        c = self.pos.last
+
+        in_atari, ds = fix_atari(self.pos, c, singlept_ok=True)
+        if ds:
+            self.pv += PRIOR_SELFATARI
+            self.pw += 0  # negative prior
+
+        patternprob = parent_pos.board.large_pattern_probability(c)
+        if patternprob is not None and patternprob > 0.001:
+            pattern_prior = math.sqrt(patternprob)  # tone up
+            self.pv += pattern_prior * PRIOR_LARGEPATTERN
+            self.pw += pattern_prior * PRIOR_LARGEPATTERN
+
     def rave_urgency(self):
+        if not self._priors_done and self.v >= 2:
+            self._apply_expensive_priors()
+        # a descent recomputes the urgency of every child of every node
+        # on the path, but between two descents only the visited path's
+        # stats move; serve the unchanged majority from the memo
+        sig = (self.v, self.w, self.av, self.aw, self.pv, self.pw)
+        if sig == self._urg_sig:
+            return self._urg
         v = self.v + self.pv
         expectation = float(self.w+self.pw) / v
         if self.av == 0:
-            return expectation
-        rave_expectation = float(self.aw) / self.av
-        beta = self.av / (self.av + v + float(v) * self.av / RAVE_EQUIV)
-        return beta * rave_expectation + (1-beta) * expectation
+            urgency = expectation
+        else:
+            rave_expectation = float(self.aw) / self.av
+            beta = self.av / (self.av + v + float(v) * self.av / RAVE_EQUIV)
+            urgency = beta * rave_expectation + (1-beta) * expectation
+        self._urg_sig = sig
+        self._urg = urgency
+        return urgency
 
     def winrate(self):
         return float(self.w) / self.v if self.v > 0 else float('nan')